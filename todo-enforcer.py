@@ -10,47 +10,55 @@ Purpose:
 This runs on UserPromptSubmit event.
 """
 
+import io
 import json
 import sys
 import os
 from pathlib import Path
-from datetime import datetime
 
-# Persistent todo state file location
+
+# Persistent todo state file location. This hook only reads state, so the
+# directory is never created here; a missing directory just means no todos.
 TODO_STATE_DIR = Path.home() / ".claude" / "todo-state"
-TODO_STATE_DIR.mkdir(parents=True, exist_ok=True)
+
+# The project directory is fixed for the lifetime of a hook process, so the
+# project ID and state file path are computed once at import.
+_PATH_SEP_TABLE = str.maketrans("/\\", "__")
+_PROJECT_ID = (
+    os.environ.get("CLAUDE_PROJECT_DIR", os.getcwd())
+    .translate(_PATH_SEP_TABLE)
+    .strip("_")[-50:]
+)
+_STATE_FILE = TODO_STATE_DIR / f"todos_{_PROJECT_ID}.json"
+
+# Prompts (lowercased, stripped) that never get the enforcement reminder
+TRIVIAL_KEYWORDS = frozenset({"hi", "hello", "hey", "thanks", "ok", "yes", "no", "?"})
 
 
 def get_project_id():
     """Generate a project-specific ID based on current directory."""
-    cwd = os.environ.get("CLAUDE_PROJECT_DIR", os.getcwd())
-    # Create a simple hash of the path
-    return cwd.replace("/", "_").replace("\\", "_").strip("_")[-50:]
+    return _PROJECT_ID
 
 
 def get_todo_state_file():
     """Get the todo state file for current project."""
-    project_id = get_project_id()
-    return TODO_STATE_DIR / f"todos_{project_id}.json"
+    return _STATE_FILE
 
 
 def read_last_todos():
     """Read last known todo state from persistent storage."""
-    state_file = get_todo_state_file()
-    if state_file.exists():
-        try:
-            with open(state_file, "r") as f:
-                data = json.load(f)
-                return data.get("todos", []), data.get("timestamp", "")
-        except (json.JSONDecodeError, IOError):
-            return [], ""
-    return [], ""
+    try:
+        with open(get_todo_state_file(), "rb") as f:
+            data = json.loads(f.read())
+        return data.get("todos", []), data.get("timestamp", "")
+    except (FileNotFoundError, ValueError, OSError):
+        return [], ""
 
 
 def main():
     try:
-        input_data = json.load(sys.stdin)
-    except json.JSONDecodeError:
+        input_data = json.loads(sys.stdin.buffer.read())
+    except ValueError:  # JSONDecodeError, or bad UTF-8 with stdlib json
         sys.exit(0)  # Don't block on bad input
 
     prompt = input_data.get("prompt", "").lower()
@@ -59,16 +67,14 @@ def main():
     last_todos, timestamp = read_last_todos()
 
     # Build context injection
-    context_parts = []
+    context = io.StringIO()
 
     # ALWAYS remind about TodoWrite for any non-trivial prompt
-    trivial_keywords = ["hi", "hello", "hey", "thanks", "ok", "yes", "no", "?"]
-    is_trivial = (
-        any(prompt.strip() == kw for kw in trivial_keywords) or len(prompt) < 10
-    )
+    stripped = prompt.strip()
+    is_trivial = stripped in TRIVIAL_KEYWORDS or len(stripped) < 10
 
     if not is_trivial:
-        context_parts.append(
+        context.write(
             """
 <todo-enforcement>
 CRITICAL REMINDER: Before starting any multi-step task:
@@ -84,33 +90,44 @@ CRITICAL REMINDER: Before starting any multi-step task:
     if last_todos:
         incomplete = [t for t in last_todos if t.get("status") != "completed"]
         if incomplete:
-            context_parts.append(
+            if context.tell():
+                context.write("\n")
+            context.write(
                 f"""
 <previous-session-todos timestamp="{timestamp}">
 IMPORTANT: The following tasks were in progress before session restart/compact:
 """
             )
-            for i, todo in enumerate(incomplete, 1):
-                status = todo.get("status", "pending")
-                content = todo.get("content", "Unknown task")
-                context_parts.append(f"  {i}. [{status.upper()}] {content}")
-
-            context_parts.append(
+            lines = [
+                f"  {i}. [{t.get('status', 'pending').upper()}] "
+                f"{t.get('content', 'Unknown task')}"
+                for i, t in enumerate(incomplete, 1)
+            ]
+            context.write("\n")
+            context.write("\n".join(lines))
+
+            context.write(
                 """
+
 Please use TodoWrite to restore/continue these tasks if they are still relevant.
 </previous-session-todos>
 """
             )
 
     # Output the context injection
-    if context_parts:
+    if context.tell():
         output = {
             "hookSpecificOutput": {
                 "hookEventName": "UserPromptSubmit",
-                "additionalContext": "\n".join(context_parts),
+                "additionalContext": context.getvalue(),
             }
         }
-        print(json.dumps(output))
+        # Default ASCII escaping, so a lone surrogate in stored todo content
+        # can't fail the encode
+        sys.stdout.buffer.write(
+            json.dumps(output, separators=(",", ":")).encode("ascii") + b"\n"
+        )
+        sys.stdout.buffer.flush()
 
     sys.exit(0)
 
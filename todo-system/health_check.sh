@@ -31,6 +31,7 @@ echo ""
 echo "📁 Hook Files:"
 HOOKS=(
     "todo_core.py"
+    "json_shim.py"
     "hook_session_start.py"
     "hook_user_prompt.py"
     "hook_post_todowrite.py"
@@ -7,19 +7,27 @@ Triggers on: After TodoWrite tool completes
 Purpose: Capture and persist todo state to disk for session continuity
 """
 
-import json
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from todo_core import update_todos, log_debug
+from json_shim import JSONDecodeError, loads
 
 
 def main():
+    raw = sys.stdin.buffer.read()
+
+    # Most PostToolUse events are for other tools; a byte scan rules them out
+    # without parsing. A false positive is still caught by the check below.
+    if b'"TodoWrite"' not in raw:
+        sys.exit(0)
+
     try:
-        input_data = json.load(sys.stdin)
-    except json.JSONDecodeError:
+        input_data = loads(raw)
+    except JSONDecodeError:
+        from todo_core import log_debug
+
         log_debug("PostToolUse[TodoWrite]: Failed to parse input")
         sys.exit(0)
 
@@ -29,6 +37,9 @@ def main():
     if tool_name != "TodoWrite":
         sys.exit(0)
 
+    # Imported late so non-TodoWrite tool calls never load todo_core
+    from todo_core import update_todos, log_debug
+
     tool_input = input_data.get("tool_input", {})
     todos = tool_input.get("todos", [])
 
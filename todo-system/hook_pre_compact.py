@@ -7,19 +7,19 @@ Triggers on: Before manual or auto compact
 Purpose: Ensure todo state is saved before context is compressed
 """
 
-import json
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from json_shim import JSONDecodeError, read_stdin
 from todo_core import load_state, save_state, get_incomplete_todos, log_debug
 
 
 def main():
     try:
-        input_data = json.load(sys.stdin)
-    except json.JSONDecodeError:
+        input_data = read_stdin()
+    except JSONDecodeError:
         sys.exit(0)
 
     trigger = input_data.get("trigger", "unknown")
@@ -27,7 +27,7 @@ def main():
 
     # Load current state and re-save to update timestamp
     state = load_state()
-    incomplete = get_incomplete_todos()
+    incomplete = get_incomplete_todos(state)
 
     if incomplete:
         log_debug(
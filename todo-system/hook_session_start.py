@@ -7,13 +7,13 @@ Triggers on: startup, resume, clear, compact
 Injects previous todos into context for continuity.
 """
 
-import json
 import sys
 import os
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from json_shim import JSONDecodeError, read_stdin, write_stdout
 from todo_core import (
     load_state,
     get_incomplete_todos,
@@ -25,8 +25,8 @@ from todo_core import (
 
 def main():
     try:
-        input_data = json.load(sys.stdin)
-    except json.JSONDecodeError:
+        input_data = read_stdin()
+    except JSONDecodeError:
         sys.exit(0)
 
     source = input_data.get("source", "unknown")
@@ -38,11 +38,12 @@ def main():
         if removed > 0:
             log_debug(f"Cleaned up {removed} old state files")
 
-    # Generate context with previous todos
-    incomplete = get_incomplete_todos()
+    # Generate context with previous todos (state is read once)
+    state = load_state()
+    incomplete = get_incomplete_todos(state)
 
     if incomplete or source in ("resume", "compact"):
-        context = generate_todo_context(include_reminder=True)
+        context = generate_todo_context(include_reminder=True, state=state)
 
         if context:
             # Add source-specific message
@@ -57,7 +58,7 @@ def main():
                     "additionalContext": context,
                 }
             }
-            print(json.dumps(output))
+            write_stdout(output)
 
     sys.exit(0)
 
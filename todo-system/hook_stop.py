@@ -7,29 +7,37 @@ Triggers on: When Claude is about to stop responding
 Purpose: Warn about incomplete todos, optionally block stop
 """
 
-import json
 import sys
 import os
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from todo_core import get_incomplete_todos, get_in_progress_todos, log_debug
+from json_shim import JSONDecodeError, read_stdin, write_stdout
 
 
 def main():
     try:
-        input_data = json.load(sys.stdin)
-    except json.JSONDecodeError:
+        input_data = read_stdin()
+    except JSONDecodeError:
         sys.exit(0)
 
+    # Imported late so malformed input never loads todo_core
+    from todo_core import (
+        load_state,
+        get_incomplete_todos,
+        log_debug,
+    )
+
     # Check if already in stop hook loop
     stop_hook_active = input_data.get("stop_hook_active", False)
     if stop_hook_active:
         log_debug("Stop hook: Already active, allowing stop to prevent loop")
         sys.exit(0)
 
-    incomplete = get_incomplete_todos()
-    in_progress = get_in_progress_todos()
+    state = load_state()
+    incomplete = get_incomplete_todos(state)
+    # Narrow the already-filtered list rather than rescanning every todo
+    in_progress = [t for t in incomplete if t["status"] == "in_progress"]
 
     log_debug(
         f"Stop hook: {len(incomplete)} incomplete, {len(in_progress)} in_progress"
@@ -52,7 +60,7 @@ Please either:
 
 Do not stop until all in_progress tasks are resolved.""",
         }
-        print(json.dumps(output))
+        write_stdout(output)
         sys.exit(0)
 
     # If there are pending todos, just warn but don't block
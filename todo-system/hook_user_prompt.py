@@ -7,19 +7,17 @@ Triggers on: Every user prompt submission
 Purpose: Inject minimal reminder + detect skill invocations
 """
 
-import json
+import io
 import sys
 import os
 import re
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from todo_core import (
-    get_incomplete_todos,
-    get_in_progress_todos,
-    generate_skill_todo_reminder,
-    log_debug,
-)
+from json_shim import JSONDecodeError, read_stdin, write_stdout
+
+# Prompts at least this long are never treated as trivial
+TRIVIAL_MAX_LENGTH = 200
 
 # Patterns that indicate trivial prompts (don't inject reminder)
 TRIVIAL_PATTERNS = [
@@ -35,101 +33,119 @@ SKILL_PATTERNS = [
     r"invoke\s+['\"]?(\w[\w-]*)['\"]?\s+skill",  # invoke 'name' skill
 ]
 
+# Only these single-pass alternations of the lists above are compiled. Each
+# skill pattern has exactly one capture group, so match.lastindex identifies
+# the branch taken.
+_TRIVIAL_COMBINED = re.compile(
+    "|".join(f"(?:{p})" for p in TRIVIAL_PATTERNS), re.IGNORECASE
+)
+_SKILL_COMBINED = re.compile(
+    "|".join(f"(?:{p})" for p in SKILL_PATTERNS), re.IGNORECASE
+)
+_SKILL_HINT = re.compile("skill", re.IGNORECASE)
+
+# Words that indicate a task request, in their common inflected forms
+# ("fixing", "tests", "updated", "built"). Whole words only, so "addition"
+# or "latest" don't count. Verbs ending in "e" drop it before -ed/-ing.
+TASK_PATTERN = re.compile(
+    r"\b(?:"
+    r"(?:build|implement|add|fix|develop|design|refactor|test)(?:s|es|ed|ing)?"
+    r"|(?:creat|mak|updat|writ|generat)(?:e|es|ed|ing)"
+    r"|built|made|wrote|written"
+    r")\b",
+    re.IGNORECASE,
+)
+
 
 def is_trivial_prompt(prompt: str) -> bool:
     """Check if prompt is trivial (no reminder needed)."""
-    prompt_clean = prompt.strip().lower()
+    stripped = prompt.strip()
 
     # Very short prompts
-    if len(prompt_clean) < 5:
+    if len(stripped) < 5:
         return True
 
-    for pattern in TRIVIAL_PATTERNS:
-        if re.match(pattern, prompt_clean, re.IGNORECASE):
-            return True
+    # No plausible trivial prompt is this long
+    if len(stripped) >= TRIVIAL_MAX_LENGTH:
+        return False
 
-    return False
+    # Patterns are case-insensitive, so no lowercase copy is needed
+    return bool(_TRIVIAL_COMBINED.match(stripped))
 
 
 def detect_skill_invocation(prompt: str) -> str | None:
     """Detect if prompt is invoking a skill, return skill name."""
-    for pattern in SKILL_PATTERNS:
-        match = re.search(pattern, prompt, re.IGNORECASE)
-        if match:
-            return match.group(1)
+    # Every skill pattern needs a "/" or the word "skill"; most prompts have
+    # neither, so skip the full alternation for them
+    if "/" not in prompt and not _SKILL_HINT.search(prompt):
+        return None
+
+    match = _SKILL_COMBINED.search(prompt)
+    if match:
+        return match.group(match.lastindex)
     return None
 
 
 def main():
     try:
-        input_data = json.load(sys.stdin)
-    except json.JSONDecodeError:
+        input_data = read_stdin()
+    except JSONDecodeError:
         sys.exit(0)
 
     prompt = input_data.get("prompt", "")
-    log_debug(f"UserPromptSubmit: prompt length={len(prompt)}")
 
-    # Skip trivial prompts
+    # Skip trivial prompts (before todo_core is even imported)
     if is_trivial_prompt(prompt):
-        log_debug("Trivial prompt detected, skipping reminder")
         sys.exit(0)
 
-    context_parts = []
+    from todo_core import (
+        get_incomplete_todos,
+        generate_skill_todo_reminder,
+        log_debug,
+    )
+
+    log_debug(f"UserPromptSubmit: prompt length={len(prompt)}")
+
+    context = io.StringIO()
 
     # Check for skill invocation - stronger reminder
     skill_name = detect_skill_invocation(prompt)
     if skill_name:
         log_debug(f"Skill invocation detected: {skill_name}")
-        context_parts.append(generate_skill_todo_reminder(skill_name))
+        context.write(generate_skill_todo_reminder(skill_name))
     else:
         # Standard reminder for non-trivial prompts
         incomplete = get_incomplete_todos()
-        in_progress = get_in_progress_todos()
 
         # Show current todos if any exist
         if incomplete:
-            context_parts.append("<active-todos>")
+            context.write("<active-todos>")
             for todo in incomplete:
                 status = todo.get("status", "pending")
                 content = todo.get("content", "?")
                 marker = "→" if status == "in_progress" else "○"
-                context_parts.append(f"  {marker} {content}")
-            context_parts.append("</active-todos>")
+                context.write(f"\n  {marker} {content}")
+            context.write("\n</active-todos>")
 
         # Add reminder only if this looks like a task request
-        task_indicators = [
-            "create",
-            "make",
-            "build",
-            "implement",
-            "add",
-            "fix",
-            "update",
-            "write",
-            "generate",
-            "develop",
-            "design",
-            "refactor",
-            "test",
-        ]
-        prompt_lower = prompt.lower()
-
-        if any(ind in prompt_lower for ind in task_indicators):
-            context_parts.append("<todo-reminder>")
-            context_parts.append(
-                "Multi-step task detected. Use TodoWrite to list ALL deliverables first."
+        if TASK_PATTERN.search(prompt):
+            if context.tell():
+                context.write("\n")
+            context.write(
+                "<todo-reminder>\n"
+                "Multi-step task detected. Use TodoWrite to list ALL deliverables first.\n"
+                "</todo-reminder>"
             )
-            context_parts.append("</todo-reminder>")
 
     # Output context if any
-    if context_parts:
+    if context.tell():
         output = {
             "hookSpecificOutput": {
                 "hookEventName": "UserPromptSubmit",
-                "additionalContext": "\n".join(context_parts),
+                "additionalContext": context.getvalue(),
             }
         }
-        print(json.dumps(output))
+        write_stdout(output)
 
     sys.exit(0)
 
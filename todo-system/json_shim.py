@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+JSON Shim - Bytes-in, bytes-out JSON helpers
+============================================
+
+Thin wrappers over the stdlib json module so hooks read stdin and write
+stdout and state files as raw bytes, with a single decode error type.
+
+orjson is deliberately not used: hooks are short-lived processes handling
+a few KB of JSON, and importing orjson costs more than it saves.
+"""
+
+import json
+import sys
+from typing import Any
+
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON from bytes or str."""
+    try:
+        return json.loads(data)
+    except UnicodeDecodeError as e:
+        # Report bad UTF-8 like any other malformed input, so callers only
+        # ever need to catch JSONDecodeError
+        raise JSONDecodeError(str(e), "", 0) from e
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """Serialize obj to JSON bytes: compact, or 2-space indented."""
+    # Default ASCII escaping: a lone surrogate (e.g. a truncated emoji in
+    # the input) would make a UTF-8 encode of the raw text fail
+    if indent:
+        text = json.dumps(obj, indent=2)
+    else:
+        text = json.dumps(obj, separators=(",", ":"))
+    return text.encode("ascii")
+
+
+def read_stdin() -> Any:
+    """Parse the hook event payload from stdin."""
+    return loads(sys.stdin.buffer.read())
+
+
+def write_stdout(obj: Any) -> None:
+    """Write obj to stdout as a single JSON line."""
+    sys.stdout.buffer.write(dumps(obj) + b"\n")
+    sys.stdout.buffer.flush()
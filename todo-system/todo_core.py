@@ -17,16 +17,15 @@ Author: Claude Code Hook System
 Version: 2.0.0
 """
 
-import json
+import atexit
+import functools
 import os
-import sys
-import tempfile
-import shutil
+import time
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Optional, Tuple, List, Dict, Any
-import hashlib
-import fcntl  # For file locking on Unix
+
+from json_shim import JSONDecodeError, dumps, loads
 
 # ============================================================================
 # CONFIGURATION
@@ -38,31 +37,90 @@ TODO_STATE_DIR.mkdir(parents=True, exist_ok=True)
 DEBUG_LOG = TODO_STATE_DIR / "debug.log"
 MAX_STATE_AGE_DAYS = 7  # Auto-cleanup states older than this
 MAX_LOG_SIZE_MB = 5  # Rotate log if larger
+LOG_ROTATE_CHECK_LINES = 1000  # Long-lived processes recheck size this often
+CLEANUP_INTERVAL_HOURS = 24  # Scan for stale states at most this often
+CLEANUP_MARKER = TODO_STATE_DIR / ".last_cleanup"
+
+# fsync state writes before the rename. Off by default: the rename alone keeps
+# the file consistent, and Claude re-emits todos if a crash loses the latest.
+FSYNC_STATE_WRITES = os.environ.get("TODO_STATE_FSYNC") == "1"
 
 # Schema version for future migrations
 SCHEMA_VERSION = 1
 
+# Process-local copy of the last state read or written, keyed by the state
+# file's (inode, mtime_ns, size), or None while the file does not exist.
+# Writes go through os.replace(), so any write from another process changes
+# the inode and invalidates the entry.
+_STATE_CACHE: Optional[Tuple[Optional[Tuple[int, int, int]], Dict[str, Any]]] = None
+
 # ============================================================================
 # LOGGING
 # ============================================================================
 
 
+# Debug log descriptor, opened on first use and kept for the process lifetime
+_DEBUG_FD: Optional[int] = None
+_DEBUG_LINES = 0  # Lines written since the last rotation check
+
+# Date and time of the last log line, reformatted only when the second changes
+_LOG_TS_SECOND = -1
+_LOG_TS_PREFIX = ""
+
+
+def _open_debug_log() -> int:
+    """Open the debug log for appending, rotating it first if too large."""
+    try:
+        if DEBUG_LOG.stat().st_size > MAX_LOG_SIZE_MB * 1024 * 1024:
+            DEBUG_LOG.replace(DEBUG_LOG.with_suffix(".log.old"))
+    except FileNotFoundError:
+        pass
+    return os.open(DEBUG_LOG, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+
+def _close_debug_log() -> None:
+    """Close the debug log descriptor, if open."""
+    global _DEBUG_FD
+
+    if _DEBUG_FD is not None:
+        os.close(_DEBUG_FD)
+        _DEBUG_FD = None
+
+
+def _log_timestamp() -> str:
+    """Local time in datetime.isoformat() form, with microseconds."""
+    global _LOG_TS_SECOND, _LOG_TS_PREFIX
+
+    second, nanos = divmod(time.time_ns(), 1_000_000_000)
+    if second != _LOG_TS_SECOND:
+        _LOG_TS_PREFIX = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(second))
+        _LOG_TS_SECOND = second
+    return f"{_LOG_TS_PREFIX}.{nanos // 1000:06d}"
+
+
 def log_debug(message: str) -> None:
     """Write debug message to log file with rotation."""
+    global _DEBUG_FD, _DEBUG_LINES
+
     try:
-        # Rotate if too large
-        if (
-            DEBUG_LOG.exists()
-            and DEBUG_LOG.stat().st_size > MAX_LOG_SIZE_MB * 1024 * 1024
-        ):
-            backup = DEBUG_LOG.with_suffix(".log.old")
-            if backup.exists():
-                backup.unlink()
-            DEBUG_LOG.rename(backup)
-
-        timestamp = datetime.now().isoformat()
-        with open(DEBUG_LOG, "a") as f:
-            f.write(f"[{timestamp}] {message}\n")
+        if _DEBUG_FD is None:
+            _DEBUG_FD = _open_debug_log()
+            atexit.register(_close_debug_log)
+        elif _DEBUG_LINES >= LOG_ROTATE_CHECK_LINES:
+            # Only a long-running process logs this much; reopen (rotating
+            # if needed) once the file we hold has outgrown the limit
+            _DEBUG_LINES = 0
+            if os.fstat(_DEBUG_FD).st_size > MAX_LOG_SIZE_MB * 1024 * 1024:
+                os.close(_DEBUG_FD)
+                # Cleared first: if the reopen fails, a stale number here
+                # would write into whatever file reuses it
+                _DEBUG_FD = None
+                _DEBUG_FD = _open_debug_log()
+        _DEBUG_LINES += 1
+
+        timestamp = _log_timestamp()
+        # One O_APPEND write per line: no buffering, no per-call open/close
+        os.write(_DEBUG_FD, f"[{timestamp}] {message}\n".encode("utf-8"))
     except Exception:
         pass  # Never crash due to logging
 
@@ -72,45 +130,73 @@ def log_debug(message: str) -> None:
 # ============================================================================
 
 
+# Claude sets these before spawning the hook and they can't change within a
+# hook process, so they are read once, and the derived project details below
+# are computed once.
+_PROJECT_DIR = os.environ.get("CLAUDE_PROJECT_DIR", os.getcwd())
+_SESSION_ID = os.environ.get("CLAUDE_SESSION_ID", "unknown")
+
+
+@functools.lru_cache(maxsize=1)
 def get_project_id() -> str:
     """Generate a unique, stable project ID from the project directory."""
-    cwd = os.environ.get("CLAUDE_PROJECT_DIR", os.getcwd())
-    # Use SHA256 hash for consistent, safe filenames
-    hash_input = cwd.encode("utf-8")
-    return hashlib.sha256(hash_input).hexdigest()[:16]
+    # Imported here: hashlib loads OpenSSL, which hooks that never touch
+    # state shouldn't pay for
+    import hashlib
 
+    # Use a 64-bit BLAKE2b hash for consistent, safe filenames
+    hash_input = _PROJECT_DIR.encode("utf-8")
+    return hashlib.blake2b(hash_input, digest_size=8).hexdigest()
 
+
+@functools.lru_cache(maxsize=1)
 def get_project_name() -> str:
     """Get human-readable project name."""
-    cwd = os.environ.get("CLAUDE_PROJECT_DIR", os.getcwd())
-    return Path(cwd).name
+    return Path(_PROJECT_DIR).name
 
 
+@functools.lru_cache(maxsize=1)
 def get_state_file() -> Path:
     """Get the state file path for current project."""
     return TODO_STATE_DIR / f"todos_{get_project_id()}.json"
 
 
+def _migrate_legacy_state_file(state_file: Path) -> bool:
+    """Rename a state file saved under the old SHA256-based project ID."""
+    import hashlib
+
+    legacy_id = hashlib.sha256(_PROJECT_DIR.encode("utf-8")).hexdigest()[:16]
+    try:
+        os.replace(TODO_STATE_DIR / f"todos_{legacy_id}.json", state_file)
+    except OSError:
+        return False
+    log_debug(f"Migrated legacy state file todos_{legacy_id}.json")
+    return True
+
+
 # ============================================================================
 # SCHEMA VALIDATION
 # ============================================================================
 
 
+REQUIRED_TODO_FIELDS = frozenset({"content", "status", "activeForm"})
+VALID_STATUSES = frozenset({"pending", "in_progress", "completed"})
+
+
 def validate_todo(todo: Dict[str, Any]) -> bool:
     """Validate a single todo item against schema."""
-    required_fields = ["content", "status", "activeForm"]
-    valid_statuses = ["pending", "in_progress", "completed"]
-
     if not isinstance(todo, dict):
         return False
 
-    for field in required_fields:
-        if field not in todo:
-            log_debug(f"Todo missing required field: {field}")
-            return False
+    if not REQUIRED_TODO_FIELDS <= todo.keys():
+        missing = ", ".join(sorted(REQUIRED_TODO_FIELDS - todo.keys()))
+        log_debug(f"Todo missing required field: {missing}")
+        return False
 
-    if todo.get("status") not in valid_statuses:
-        log_debug(f"Todo has invalid status: {todo.get('status')}")
+    status = todo["status"]
+    # isinstance first: a list or dict status can't be hashed for the lookup
+    if not isinstance(status, str) or status not in VALID_STATUSES:
+        log_debug(f"Todo has invalid status: {status}")
         return False
 
     return True
@@ -131,6 +217,17 @@ def validate_state(state: Dict[str, Any]) -> bool:
     return all(validate_todo(t) for t in todos)
 
 
+def repair_state(state: Any) -> Optional[Dict[str, Any]]:
+    """Fully validate a state that failed load_state's quick check.
+
+    Returns the state if it passes validate_state, otherwise None.
+    """
+    if not validate_state(state):
+        return None
+    log_debug(f"Accepted state with schema_version {state['schema_version']}")
+    return state
+
+
 # ============================================================================
 # ATOMIC FILE OPERATIONS
 # ============================================================================
@@ -141,51 +238,68 @@ def atomic_write(filepath: Path, data: Dict[str, Any]) -> bool:
     Write data atomically using temp file + rename.
     This ensures we never have a corrupted state file.
     """
+    # Same directory (required for atomic rename); the pid keeps concurrent
+    # hook processes off each other's temp files
+    temp_path = filepath.parent / f".tmp_{filepath.name}.{os.getpid()}"
     try:
-        # Create temp file in same directory (required for atomic rename)
-        fd, temp_path = tempfile.mkstemp(
-            dir=filepath.parent, prefix=".tmp_", suffix=".json"
-        )
+        # Serialize up front so the file gets one write, not the many small
+        # chunks a streaming encoder emits
+        payload = dumps(data)
 
+        # No lock needed: nobody else can see the temp file, and the rename
+        # swaps the whole file in at once
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
         try:
-            with os.fdopen(fd, "w") as f:
-                # Acquire exclusive lock
-                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
-                json.dump(data, f, indent=2, default=str)
-                f.flush()
-                os.fsync(f.fileno())
-                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-
-            # Atomic rename
-            shutil.move(temp_path, filepath)
-            log_debug(f"Atomic write successful: {filepath.name}")
-            return True
-
-        except Exception as e:
-            # Clean up temp file on error
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
-            raise e
+            view = memoryview(payload)
+            while view:
+                view = view[os.write(fd, view):]
+            if FSYNC_STATE_WRITES:
+                os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        # Atomic rename (same directory, so never a cross-device copy)
+        os.replace(temp_path, filepath)
+        log_debug(f"Atomic write successful: {filepath.name}")
+        return True
 
     except Exception as e:
+        # Clean up temp file on error
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
         log_debug(f"Atomic write failed: {e}")
         return False
 
 
 def safe_read(filepath: Path) -> Optional[Dict[str, Any]]:
-    """Safely read and parse JSON file with locking."""
-    if not filepath.exists():
+    """Safely read and parse JSON file.
+
+    Writers replace the file by rename, so a reader always sees either the
+    old or the new version in full and no lock is needed.
+    """
+    try:
+        fd = os.open(filepath, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        log_debug(f"Safe read failed: {e}")
         return None
 
     try:
-        with open(filepath, "r") as f:
-            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
-            data = json.load(f)
-            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-            return data
-    except (json.JSONDecodeError, IOError) as e:
+        # fstat on the open fd: the size can't change under us, since a
+        # rename swaps in a new file rather than rewriting this one
+        size = os.fstat(fd).st_size
+        if size == 0:
+            log_debug(f"Safe read skipped empty file: {filepath.name}")
+            return None
+        return loads(os.read(fd, size))
+    except (JSONDecodeError, OSError) as e:
         log_debug(f"Safe read failed: {e}")
         return None
+    finally:
+        os.close(fd)
 
 
 # ============================================================================
@@ -202,45 +316,120 @@ def create_empty_state() -> Dict[str, Any]:
         "todos": [],
         "created_at": datetime.now().isoformat(),
         "updated_at": datetime.now().isoformat(),
-        "session_id": os.environ.get("CLAUDE_SESSION_ID", "unknown"),
+        "session_id": _SESSION_ID,
     }
 
 
+def _state_file_key(state_file: Path) -> Optional[Tuple[int, int, int]]:
+    """Identify the current on-disk version of a state file."""
+    try:
+        st = os.stat(state_file)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
 def load_state() -> Dict[str, Any]:
     """Load state from disk, creating new if needed."""
-    state_file = get_state_file()
-    state = safe_read(state_file)
+    global _STATE_CACHE
 
-    if state is None or not validate_state(state):
+    state_file = get_state_file()
+    key = _state_file_key(state_file)
+    if _STATE_CACHE is not None and _STATE_CACHE[0] == key:
+        return _STATE_CACHE[1]
+
+    if key is None and _migrate_legacy_state_file(state_file):
+        key = _state_file_key(state_file)
+
+    state = safe_read(state_file) if key is not None else None
+
+    # save_state only ever writes validated todos, so for a current-schema
+    # file a type check per todo is enough to keep the todo helpers from
+    # crashing; anything else (an older schema, a non-dict todo in a
+    # hand-edited file) gets the full check
+    if state is not None and not (
+        isinstance(state, dict)
+        and state.get("schema_version") == SCHEMA_VERSION
+        and isinstance(state.get("todos"), list)
+        and all(type(t) is dict for t in state["todos"])
+    ):
+        state = repair_state(state)
+
+    if state is None:
         log_debug("Creating new state (none found or invalid)")
-        return create_empty_state()
+        state = create_empty_state()
 
+    # Cache the fresh empty state too, so repeated loads on a new project
+    # don't rebuild and re-log it
+    _STATE_CACHE = (key, state)
     return state
 
 
 def save_state(state: Dict[str, Any]) -> bool:
     """Save state to disk atomically."""
+    global _STATE_CACHE
+
     state["updated_at"] = datetime.now().isoformat()
-    state["session_id"] = os.environ.get("CLAUDE_SESSION_ID", "unknown")
-    return atomic_write(get_state_file(), state)
+    state["session_id"] = _SESSION_ID
+    state_file = get_state_file()
+    if not atomic_write(state_file, state):
+        _STATE_CACHE = None
+        return False
+
+    _STATE_CACHE = (_state_file_key(state_file), state)
+    return True
+
+
+def _load_state_metadata() -> Optional[Dict[str, Any]]:
+    """Load state for a caller that replaces the whole todo list.
+
+    Like load_state, but the stored todos are about to be discarded, so
+    they are not validated and the result is not cached. Returns None if
+    there is no usable state file.
+    """
+    state_file = get_state_file()
+    key = _state_file_key(state_file)
+    if _STATE_CACHE is not None and _STATE_CACHE[0] == key:
+        return _STATE_CACHE[1]
+
+    if key is None and _migrate_legacy_state_file(state_file):
+        key = _state_file_key(state_file)
+
+    state = safe_read(state_file) if key is not None else None
+    if not isinstance(state, dict) or "schema_version" not in state:
+        return None
+    return state
 
 
 def update_todos(todos: List[Dict[str, Any]]) -> bool:
     """Update todos in state and persist."""
-    state = load_state()
+    state = _load_state_metadata()
 
     # Validate all todos
     valid_todos = [t for t in todos if validate_todo(t)]
     if len(valid_todos) != len(todos):
         log_debug(f"Filtered {len(todos) - len(valid_todos)} invalid todos")
 
+    if state is None:
+        state = create_empty_state()
+    elif (
+        state.get("todos") == valid_todos
+        and state.get("session_id") == _SESSION_ID
+    ):
+        # Nothing to record: the file already holds these todos for this session
+        log_debug("Todos unchanged, skipping write")
+        return True
+
     state["todos"] = valid_todos
     return save_state(state)
 
 
-def get_incomplete_todos() -> List[Dict[str, Any]]:
+def get_incomplete_todos(
+    state: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
     """Get all incomplete (pending or in_progress) todos."""
-    state = load_state()
+    if state is None:
+        state = load_state()
     return [
         t
         for t in state.get("todos", [])
@@ -248,9 +437,12 @@ def get_incomplete_todos() -> List[Dict[str, Any]]:
     ]
 
 
-def get_in_progress_todos() -> List[Dict[str, Any]]:
+def get_in_progress_todos(
+    state: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
     """Get todos currently in progress."""
-    state = load_state()
+    if state is None:
+        state = load_state()
     return [t for t in state.get("todos", []) if t.get("status") == "in_progress"]
 
 
@@ -262,22 +454,36 @@ def get_in_progress_todos() -> List[Dict[str, Any]]:
 def cleanup_old_states() -> int:
     """Remove state files older than MAX_STATE_AGE_DAYS. Returns count removed."""
     removed = 0
-    cutoff = datetime.now() - timedelta(days=MAX_STATE_AGE_DAYS)
+    cutoff = (datetime.now() - timedelta(days=MAX_STATE_AGE_DAYS)).timestamp()
 
+    # Skip the directory scan if one already ran recently
     try:
-        for state_file in TODO_STATE_DIR.glob("todos_*.json"):
-            try:
-                state = safe_read(state_file)
-                if state:
-                    updated = state.get("updated_at", "")
-                    if updated:
-                        updated_dt = datetime.fromisoformat(updated)
-                        if updated_dt < cutoff:
-                            state_file.unlink()
-                            removed += 1
-                            log_debug(f"Cleaned up old state: {state_file.name}")
-            except (ValueError, OSError) as e:
-                log_debug(f"Cleanup error for {state_file}: {e}")
+        last_run = CLEANUP_MARKER.stat().st_mtime
+        if time.time() - last_run < CLEANUP_INTERVAL_HOURS * 3600:
+            return 0
+    except OSError:
+        pass
+
+    try:
+        # scandir yields names and file types without a stat per entry
+        with os.scandir(TODO_STATE_DIR) as entries:
+            for entry in entries:
+                if not (
+                    entry.name.startswith("todos_")
+                    and entry.name.endswith(".json")
+                    and entry.is_file()
+                ):
+                    continue
+                try:
+                    # Every save replaces the file, so its mtime tracks
+                    # updated_at without parsing the JSON
+                    if entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                        removed += 1
+                        log_debug(f"Cleaned up old state: {entry.name}")
+                except OSError as e:
+                    log_debug(f"Cleanup error for {entry.path}: {e}")
+        CLEANUP_MARKER.touch()
     except Exception as e:
         log_debug(f"Cleanup failed: {e}")
 
@@ -289,41 +495,46 @@ def cleanup_old_states() -> int:
 # ============================================================================
 
 
-def generate_todo_context(include_reminder: bool = True) -> str:
-    """Generate context string for injection into Claude's context."""
-    parts = []
+_PROTOCOL_BLOCK = (
+    "<todo-protocol>\n"
+    "MANDATORY: For multi-step tasks, use TodoWrite IMMEDIATELY:\n"
+    "1. Create ALL deliverables as separate todo items BEFORE starting\n"
+    "2. Mark in_progress BEFORE working, completed AFTER finishing\n"
+    "3. Never batch completions - mark done immediately\n"
+    "</todo-protocol>"
+)
 
-    # Get current state
-    incomplete = get_incomplete_todos()
-    in_progress = get_in_progress_todos()
-    state = load_state()
-
-    if incomplete:
-        parts.append("<current-todos>")
-        parts.append(f"Project: {state.get('project_name', 'Unknown')}")
-        parts.append(f"Last updated: {state.get('updated_at', 'Unknown')}")
-        parts.append("")
 
-        for i, todo in enumerate(incomplete, 1):
-            status = todo.get("status", "pending").upper()
-            content = todo.get("content", "Unknown")
-            marker = "→" if status == "IN_PROGRESS" else "○"
-            parts.append(f"  {marker} [{status}] {content}")
-
-        parts.append("</current-todos>")
-        parts.append("")
+def generate_todo_context(
+    include_reminder: bool = True, state: Optional[Dict[str, Any]] = None
+) -> str:
+    """Generate context string for injection into Claude's context."""
+    # Get current state
+    if state is None:
+        state = load_state()
+    incomplete = get_incomplete_todos(state)
+
+    if not incomplete:
+        return _PROTOCOL_BLOCK if include_reminder else ""
+
+    # Incomplete todos always have a pending or in_progress status
+    todo_lines = "\n".join(
+        f"  {'→' if t['status'] == 'in_progress' else '○'} "
+        f"[{t['status'].upper()}] {t.get('content', 'Unknown')}"
+        for t in incomplete
+    )
+    current = (
+        "<current-todos>\n"
+        f"Project: {state.get('project_name', 'Unknown')}\n"
+        f"Last updated: {state.get('updated_at', 'Unknown')}\n"
+        "\n"
+        f"{todo_lines}\n"
+        "</current-todos>\n"
+    )
 
     if include_reminder:
-        parts.append("<todo-protocol>")
-        parts.append("MANDATORY: For multi-step tasks, use TodoWrite IMMEDIATELY:")
-        parts.append(
-            "1. Create ALL deliverables as separate todo items BEFORE starting"
-        )
-        parts.append("2. Mark in_progress BEFORE working, completed AFTER finishing")
-        parts.append("3. Never batch completions - mark done immediately")
-        parts.append("</todo-protocol>")
-
-    return "\n".join(parts) if parts else ""
+        return f"{current}\n{_PROTOCOL_BLOCK}"
+    return current
 
 
 def generate_skill_todo_reminder(skill_name: str) -> str:
@@ -347,6 +558,17 @@ Do NOT proceed with the skill until todos are created.
 # ============================================================================
 
 if __name__ == "__main__":
+    import sys
+
+    # State files are stored compact; --pretty prints this project's indented
+    if "--pretty" in sys.argv[1:]:
+        state = safe_read(get_state_file())
+        if state is None:
+            print(f"No state file: {get_state_file()}")
+        else:
+            sys.stdout.buffer.write(dumps(state, indent=True) + b"\n")
+        sys.exit(0)
+
     # Test the module
     print("Todo Core Module Test")
     print("=" * 40)